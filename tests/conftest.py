@@ -0,0 +1,23 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """app_min imported from a scratch working directory, so ./context and other
+    relative state files are not created in the checkout."""
+    workdir = tmp_path_factory.mktemp("app")
+    previous = os.getcwd()
+    os.chdir(workdir)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    try:
+        yield importlib.import_module("app_min")
+    finally:
+        os.chdir(previous)
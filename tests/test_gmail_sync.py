@@ -0,0 +1,233 @@
+"""sync_gmail_inbound_messages against a fake Gmail service and an in-memory email log."""
+import pytest
+
+
+class _HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = type("Resp", (), {"status": status})()
+
+
+class _Call:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+
+class FakeGmail:
+    """Just enough of users().{getProfile,history,messages} for the sync."""
+
+    def __init__(self, messages, *, profile_history_id=500, history=None, query_matches=None):
+        self.messages_by_id = {m["id"]: m for m in messages}
+        self.profile_history_id = profile_history_id
+        self.history_response = history
+        self.query_matches = query_matches
+        self.deleted = set()
+        self.history_calls = 0
+
+    def users(self):
+        return self
+
+    def getProfile(self, userId):
+        return _Call(lambda: {"historyId": str(self.profile_history_id)})
+
+    def history(self):
+        return _History(self)
+
+    def messages(self):
+        return _Messages(self)
+
+
+class _History:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, **params):
+        def run():
+            self.gmail.history_calls += 1
+            if isinstance(self.gmail.history_response, Exception):
+                raise self.gmail.history_response
+            return self.gmail.history_response
+        return _Call(run)
+
+
+class _Messages:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, **params):
+        def run():
+            ids = [i for i in self.gmail.messages_by_id if i not in self.gmail.deleted]
+            if params.get("q") and self.gmail.query_matches is not None:
+                ids = [i for i in ids if i in self.gmail.query_matches]
+            return {"messages": [{"id": i} for i in ids]}
+        return _Call(run)
+
+    def get(self, userId, id, format):
+        def run():
+            if id in self.gmail.deleted or id not in self.gmail.messages_by_id:
+                raise _HttpError(404)
+            return self.gmail.messages_by_id[id]
+        return _Call(run)
+
+
+class FakeConn:
+    """Handles the statements the sync issues; stores rows and the history cursor in memory."""
+
+    def __init__(self, history_id=None, fail_inserts=0):
+        self.history_id = history_id
+        self.rows = {}
+        self.fail_inserts = fail_inserts
+
+    def cursor(self):
+        return _Cursor(self)
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        params = list(params or [])
+        self.result = []
+        if sql.startswith("SELECT history_id"):
+            if self.conn.history_id is not None:
+                self.result = [{"history_id": self.conn.history_id}]
+        elif sql.startswith("INSERT INTO") and "gmail_sync_state" in sql:
+            self.conn.history_id = max(self.conn.history_id or 0, int(params[1]))
+        elif sql.startswith("SELECT message_id"):
+            self.result = [{"message_id": i} for i in params if i in self.conn.rows]
+        elif sql.startswith("INSERT IGNORE INTO"):
+            if self.conn.fail_inserts:
+                self.conn.fail_inserts -= 1
+                raise RuntimeError("insert failed")
+            self.rowcount = 0
+            for start in range(0, len(params), 12):
+                message_id = params[start + 8]
+                if message_id not in self.conn.rows:
+                    self.conn.rows[message_id] = params[start : start + 12]
+                    self.rowcount += 1
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return list(self.result)
+
+
+def _message(msg_id, internal_ts=1_700_000_000):
+    return {
+        "id": msg_id,
+        "threadId": f"t-{msg_id}",
+        "internalDate": str(internal_ts * 1000),
+        "snippet": f"body of {msg_id}",
+        "labelIds": ["INBOX"],
+        "payload": {"headers": [{"name": "From", "value": "Driver <d@example.com>"}, {"name": "Subject", "value": msg_id}]},
+    }
+
+
+def _history(ids, history_id=600, record_id=None):
+    return {
+        "history": [
+            {"id": str(record_id or history_id), "messagesAdded": [{"message": {"id": i, "labelIds": ["INBOX"]}} for i in ids]}
+        ],
+        "historyId": str(history_id),
+    }
+
+
+@pytest.fixture
+def conn(app, monkeypatch):
+    db = FakeConn()
+    monkeypatch.setattr(app, "mysql_available", lambda: True)
+    monkeypatch.setattr(app, "get_mysql", lambda: db)
+    monkeypatch.setattr(app, "_ensure_email_logs_table", lambda *a, **k: None)
+    monkeypatch.setattr(app, "GMAIL_SYNC_FETCH_WORKERS", 1)
+    monkeypatch.setattr(app, "GMAIL_QUERY", "in:inbox")
+    return db
+
+
+def test_first_sync_lists_mailbox_and_stores_profile_history_id(app, conn):
+    gmail = FakeGmail([_message("a"), _message("b")], profile_history_id=500)
+    inserted, skipped = app.sync_gmail_inbound_messages(service_factory=lambda: gmail)
+    assert (inserted, skipped) == (2, 0)
+    assert set(conn.rows) == {"a", "b"}
+    assert conn.history_id == 500
+    assert gmail.history_calls == 0
+
+
+def test_history_delta_only_fetches_new_messages(app, conn):
+    conn.history_id = 500
+    conn.rows["a"] = ()
+    gmail = FakeGmail([_message("a"), _message("c")], history=_history(["a", "c"], history_id=620))
+    inserted, skipped = app.sync_gmail_inbound_messages(service_factory=lambda: gmail)
+    assert (inserted, skipped) == (1, 1)
+    assert "c" in conn.rows
+    assert conn.history_id == 620
+
+
+def test_expired_history_id_falls_back_to_full_listing(app, conn):
+    conn.history_id = 10
+    gmail = FakeGmail([_message("a")], profile_history_id=900, history=_HttpError(404))
+    inserted, _ = app.sync_gmail_inbound_messages(service_factory=lambda: gmail)
+    assert inserted == 1
+    assert conn.history_id == 900
+
+
+def test_deleted_messages_count_as_processed(app, conn):
+    conn.history_id = 500
+    gmail = FakeGmail([_message("a"), _message("gone")], history=_history(["a", "gone"], history_id=610))
+    gmail.deleted.add("gone")
+    inserted, skipped = app.sync_gmail_inbound_messages(service_factory=lambda: gmail)
+    assert (inserted, skipped) == (1, 1)
+    assert conn.history_id == 610
+
+
+def test_history_results_are_filtered_by_gmail_query(app, conn):
+    conn.history_id = 500
+    gmail = FakeGmail(
+        [_message("inbox"), _message("archived")],
+        history=_history(["inbox", "archived"], history_id=630),
+        query_matches={"inbox"},
+    )
+    inserted, skipped = app.sync_gmail_inbound_messages(service_factory=lambda: gmail)
+    assert (inserted, skipped) == (1, 1)
+    assert set(conn.rows) == {"inbox"}
+    assert conn.history_id == 630
+
+
+def test_cursor_not_advanced_after_partial_insert(app, conn, monkeypatch):
+    monkeypatch.setattr(app, "GMAIL_SYNC_INSERT_BATCH", 1)
+    conn.history_id = 500
+    conn.fail_inserts = 1
+    gmail = FakeGmail([_message("a"), _message("b")], history=_history(["a", "b"], history_id=640))
+    inserted, _ = app.sync_gmail_inbound_messages(service_factory=lambda: gmail)
+    assert inserted == 1
+    assert conn.history_id == 500
+
+
+def test_history_cycle_is_capped_and_resumes_from_last_record(app, conn, monkeypatch):
+    monkeypatch.setattr(app, "GMAIL_SYNC_HISTORY_MAX_IDS", 2)
+    conn.history_id = 500
+    gmail = FakeGmail([_message(i) for i in ("a", "b", "c")])
+    gmail.history_response = {
+        "history": [
+            {"id": "510", "messagesAdded": [{"message": {"id": "a"}}, {"message": {"id": "b"}}]},
+            {"id": "520", "messagesAdded": [{"message": {"id": "c"}}]},
+        ],
+        "historyId": "700",
+    }
+    inserted, _ = app.sync_gmail_inbound_messages(service_factory=lambda: gmail)
+    assert inserted == 2
+    assert set(conn.rows) == {"a", "b"}
+    assert conn.history_id == 510
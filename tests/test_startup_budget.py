@@ -0,0 +1,48 @@
+"""Cold-start budget gate: fails when importing app_min exceeds STARTUP_IMPORT_BUDGET_MS
+or the first request exceeds STARTUP_FIRST_REQUEST_BUDGET_MS."""
+import json
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+APP = Path(__file__).resolve().parents[1] / "app_min.py"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _run_benchmark(tmp_path, *args, **env):
+    # Run from a scratch directory so the app's ./context folder is not created in the checkout.
+    result = subprocess.run(
+        [sys.executable, str(APP), "--startup-benchmark", *(args or ("--import-only", "--runs", "3"))],
+        cwd=str(tmp_path),
+        env=dict(os.environ, **env),
+        capture_output=True,
+        text=True,
+        timeout=600,
+    )
+    report = json.loads(result.stdout[result.stdout.index("{"):])
+    return result.returncode, report
+
+
+def test_import_within_budget(tmp_path):
+    code, report = _run_benchmark(tmp_path)
+    assert report["import_ms"] <= report["import_budget_ms"], report
+    assert code == 0
+
+
+def test_budget_overrun_fails(tmp_path):
+    code, report = _run_benchmark(tmp_path, STARTUP_IMPORT_BUDGET_MS="1")
+    assert not report["within_budget"]
+    assert code == 1
+
+
+def test_first_request_within_budget(tmp_path):
+    code, report = _run_benchmark(tmp_path, "--runs", "1", "--port", str(_free_port()))
+    assert report["first_request_ms"] <= report["first_request_budget_ms"], report
+    assert code == 0
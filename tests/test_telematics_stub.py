@@ -0,0 +1,59 @@
+"""Telematics cache paths against the offline TELEMATICS_STUB_PATH provider."""
+import json
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def stub(app, tmp_path, monkeypatch):
+    path = tmp_path / "positions.json"
+    path.write_text(
+        json.dumps(
+            {
+                "vehicles": [
+                    {"registration": "CA 123 456", "latitude": -26.1, "longitude": 28.05, "address": "Sandton"},
+                    {"registration": "GP 999", "latitude": -25.7, "longitude": 28.2, "address": "Pretoria"},
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(app, "TELEMATICS_STUB_PATH", str(path))
+    monkeypatch.setattr(app, "TELEMATICS_PROVIDER_PRIORITY", "stub")
+    monkeypatch.setattr(app, "mysql_available", lambda: False)
+    monkeypatch.setitem(app._driver_roster_cache, "drivers", [])
+    monkeypatch.setattr(app, "_telematics_positions", {})
+    monkeypatch.setattr(app, "_telematics_watch", {})
+    monkeypatch.setattr(app, "_telematics_inflight", set())
+    return path
+
+
+def test_poll_fills_cache_for_reads(app, stub):
+    assert app.get_vehicle_position("CA123456") is None
+    stats = app.poll_telematics_positions()
+    assert stats["positions"] == 2
+    location = app.get_vehicle_position("ca 123456")
+    assert location["latitude"] == -26.1
+    assert location["longitude"] == 28.05
+    assert app.get_vehicle_position("CA123456", max_age_seconds=-1) is None
+
+
+def test_cache_miss_queues_one_background_refresh(app, stub):
+    assert app.get_vehicle_position("GP999") is None
+    gate = threading.Event()
+    done = threading.Event()
+    results = []
+
+    def on_result(location):
+        results.append(location)
+        gate.wait(5)
+        done.set()
+
+    assert app.request_vehicle_position_refresh("GP 999", on_result=on_result) is True
+    # A second request while the first is in flight is not queued again.
+    assert app.request_vehicle_position_refresh("GP999") is False
+    gate.set()
+    assert done.wait(5)
+    assert results and results[0]["address"] == "Pretoria"
+    assert app.get_vehicle_position("GP999")["latitude"] == -25.7
@@ -0,0 +1,60 @@
+"""Voice-note transcription service with a local backend in place of OpenAI."""
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def backend(app):
+    calls = []
+    release = threading.Event()
+    release.set()
+
+    def fake(data, mime_type):
+        calls.append(data)
+        release.wait(5)
+        return f"transcript of {data.decode()}"
+
+    app.set_transcription_backend(fake)
+    yield calls, release
+    release.set()
+    app.set_transcription_backend(None)
+
+
+def test_repeat_audio_is_served_from_cache(app, backend):
+    calls, _ = backend
+    hits_before = app.get_transcription_metrics()["cache_hits"]
+    assert app.transcribe_audio_bytes(b"note-1", mime_type="audio/ogg") == ("transcript of note-1", None)
+    assert app.transcribe_audio_bytes(b"note-1", mime_type="audio/ogg") == ("transcript of note-1", None)
+    assert calls == [b"note-1"]
+    assert app.get_transcription_metrics()["cache_hits"] == hits_before + 1
+
+
+def test_timeout_returns_and_late_result_lands_in_cache(app, backend):
+    calls, release = backend
+    release.clear()
+    assert app.transcribe_audio_bytes(b"slow", timeout=0.1) == (None, "timeout")
+    release.set()
+    deadline = time.time() + 5
+    while app._transcribe_cache_get(app.hashlib.sha256(b"slow").hexdigest()) is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert app.transcribe_audio_bytes(b"slow") == ("transcript of slow", None)
+    assert calls == [b"slow"]
+
+
+def test_full_queue_rejects_without_calling_backend(app, backend, monkeypatch):
+    calls, release = backend
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(app, "_transcribe_slots", slots)
+    release.clear()
+    # The timed-out job keeps the only slot until its backend call finishes.
+    assert app.transcribe_audio_bytes(b"busy", timeout=0.1) == (None, "timeout")
+    rejected_before = app.get_transcription_metrics()["rejected"]
+    assert app.transcribe_audio_bytes(b"other") == (None, "queue_full")
+    assert app.get_transcription_metrics()["rejected"] == rejected_before + 1
+    assert calls == [b"busy"]
+    release.set()
+    # Let the job hand its slot back before the original semaphore is restored.
+    assert slots.acquire(timeout=5)
+    slots.release()